@@ -2,43 +2,122 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+import base64
+import binascii
+import hashlib
+import hmac
+import threading
+import time
 from typing import Optional, Literal
-from datetime import datetime, timezone
+from datetime import datetime
 from uuid import UUID
 
-import jwt
-from fastapi import FastAPI, Header, HTTPException, Depends, status
+import cachetools
+import orjson
+from fastapi import FastAPI, Body, Header, HTTPException, Depends, Query, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy.engine import make_url
+import asyncpg
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://postgres:postgres@db:5432/tbank_case")
-JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
+JWT_SECRET_BYTES = os.getenv("JWT_SECRET", "dev-secret-change-me").encode("utf-8")
 JWT_ALG = "HS256"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "20"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "60"))
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+# Handlers talk to asyncpg directly; the SQLAlchemy URL is only parsed so the
+# existing DATABASE_URL format (and options such as ?ssl=disable) keep working.
+pool: asyncpg.Pool | None = None
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# Principals of verified JWTs keyed by sha256(token); the raw token is never stored.
+JWT_CACHE_TTL = 5.0
+_jwt_cache = cachetools.LRUCache(maxsize=10000)
+_jwt_cache_lock = threading.Lock()
+
 class Principal(BaseModel):
+    # frozen: one cached instance is shared by every request carrying the same token
+    model_config = ConfigDict(frozen=True)
+
     sub: str
-    roles: list[str] = []
+    roles: frozenset[str] = frozenset()
+
+def _b64url_decode(part: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(part + "=" * (-len(part) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError("bad base64url segment")
+
+# Mirrors PyJWT 2.9's jwt.decode(..., algorithms=[JWT_ALG]) with no audience, issuer
+# or leeway configured: exp/nbf/iat compared as ints and any non-empty aud rejected,
+# since no audience is accepted. A kid must also be a string, as in PyJWT's
+# get_unverified_header. The HMAC runs straight on OpenSSL via hmac/hashlib and
+# claims are parsed with orjson.
+def _decode_jwt(token: str, now: float) -> dict:
+    try:
+        header_b64, payload_b64, sig_b64 = token.split(".")
+    except ValueError:
+        raise ValueError("not a JWS compact token")
+    try:
+        header = orjson.loads(_b64url_decode(header_b64))
+    except orjson.JSONDecodeError:
+        raise ValueError("bad header")
+    if not isinstance(header, dict) or header.get("alg") != JWT_ALG:
+        raise ValueError("unexpected alg")
+    if "kid" in header and not isinstance(header["kid"], str):
+        raise ValueError("kid must be a string")
+    expected = hmac.new(JWT_SECRET_BYTES, f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, _b64url_decode(sig_b64)):
+        raise ValueError("bad signature")
+    try:
+        payload = orjson.loads(_b64url_decode(payload_b64))
+    except orjson.JSONDecodeError:
+        raise ValueError("bad payload")
+    if not isinstance(payload, dict):
+        raise ValueError("bad payload")
+    for claim in ("exp", "nbf", "iat"):
+        value = payload.get(claim)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(f"{claim} must be numeric")
+    if "exp" in payload and int(payload["exp"]) <= now:
+        raise ValueError("expired")
+    if "nbf" in payload and int(payload["nbf"]) > now:
+        raise ValueError("not yet valid")
+    if "iat" in payload and int(payload["iat"]) > now:
+        raise ValueError("issued in the future")
+    if payload.get("aud"):
+        raise ValueError("audience not accepted")
+    return payload
 
 async def get_principal(token: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> Principal:
     if token is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
+    key = hashlib.sha256(token.credentials.encode()).digest()
+    now = time.time()
+    with _jwt_cache_lock:
+        cached = _jwt_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
     try:
-        payload = jwt.decode(token.credentials, JWT_SECRET, algorithms=[JWT_ALG])
-    except jwt.PyJWTError:
+        payload = _decode_jwt(token.credentials, now)
+    except ValueError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    return Principal(sub=str(payload.get("sub", "unknown")), roles=payload.get("roles", []))
+    # entry lives min(JWT_CACHE_TTL, exp - now) so an expired token is never served from cache
+    expires = now + JWT_CACHE_TTL
+    if "exp" in payload:
+        expires = min(expires, int(payload["exp"]))
+    principal = Principal(sub=str(payload.get("sub", "unknown")), roles=frozenset(payload.get("roles", [])))
+    with _jwt_cache_lock:
+        _jwt_cache[key] = (expires, principal)
+    return principal
 
 def require_roles(*required: str):
-    def checker(principal: Principal = Depends(get_principal)):
-        if not any(r in principal.roles for r in required):
+    req = frozenset(required)
+    async def checker(principal: Principal = Depends(get_principal)):
+        if principal.roles.isdisjoint(req):
             raise HTTPException(status_code=403, detail="Forbidden: insufficient role")
         return principal
     return checker
@@ -72,151 +151,215 @@ class ErrorModel(BaseModel):
     code: str
     message: str
 
-app = FastAPI(title="T-Bank Payments Hold API (JWT/RBAC)")
+# Hold columns in a fixed order; rows are read positionally into the API shape.
+_HOLD_COLS = (
+    "hold_id, client_id, type, status, comment, source, created_at, created_by,"
+    " expires_at, released_at, released_by, release_reason, idempotency_key"
+)
+_HOLD_KEYS = (
+    "holdId", "clientId", "type", "status", "comment", "source", "createdAt", "createdBy",
+    "expiresAt", "releasedAt", "releasedBy", "releaseReason", "idempotencyKey",
+)
+
+# SQL is fixed at import so asyncpg's per-connection statement cache keeps hitting.
+# The INSERT is a single round-trip: the client FK rejects unknown clients and
+# ON CONFLICT replays an existing hold for a repeated Idempotency-Key. The replay
+# is scoped to the same client; a key reused by another client returns no row.
+_Q_INS = f"""
+    INSERT INTO payment_hold
+        (client_id, type, status, comment, source, created_by, expires_at, idempotency_key)
+    VALUES
+    ($1, $2, 'ACTIVE', $3, $4, $5, $6, $7)
+    ON CONFLICT (idempotency_key) DO UPDATE SET idempotency_key = EXCLUDED.idempotency_key
+        WHERE payment_hold.client_id = EXCLUDED.client_id
+    RETURNING {_HOLD_COLS}
+"""
+
+# Keyset pagination on (created_at, hold_id): created_at alone is not unique, since
+# now() is fixed per transaction. $2/$3 are the last row of the previous page,
+# NULL for the first page, coalesced so the predicate stays an index range condition.
+_Q_LIST_ALL = f"""
+    SELECT {_HOLD_COLS} FROM payment_hold
+    WHERE client_id = $1
+      AND (created_at, hold_id) < (coalesce($2::timestamptz, 'infinity'), coalesce($3::uuid, uuid_nil()))
+    ORDER BY created_at DESC, hold_id DESC
+    LIMIT $4
+"""
+
+_Q_LIST_STATUS = f"""
+    SELECT {_HOLD_COLS} FROM payment_hold
+    WHERE client_id = $1 AND status = $5
+      AND (created_at, hold_id) < (coalesce($2::timestamptz, 'infinity'), coalesce($3::uuid, uuid_nil()))
+    ORDER BY created_at DESC, hold_id DESC
+    LIMIT $4
+"""
+
+# Blocked/kind are decided in Postgres and the active holds come back as one
+# JSON array already in the API shape, so a single row crosses the wire.
+_Q_CHECK = """
+    SELECT
+        count(*) > 0 AS blocked,
+        coalesce(bool_or(type = 'FRAUD_SUSPECT'), false) AS fraud,
+        json_agg(json_build_object(
+            'holdId', hold_id, 'clientId', client_id, 'type', type, 'status', status,
+            'comment', comment, 'source', source, 'createdAt', created_at, 'createdBy', created_by,
+            'expiresAt', expires_at, 'releasedAt', released_at, 'releasedBy', released_by,
+            'releaseReason', release_reason, 'idempotencyKey', idempotency_key
+        )) AS holds
+    FROM payment_hold
+    WHERE client_id = $1 AND status = 'ACTIVE'
+"""
 
-def _now():
-    return datetime.now(timezone.utc)
+_Q_GET = f"""
+    SELECT {_HOLD_COLS} FROM payment_hold
+    WHERE client_id = $1 AND hold_id = $2
+"""
+
+# Status is checked in the UPDATE itself, so a concurrent release cannot slip in
+# between check and write; a miss is resolved into 404/409 with _Q_GET.
+_Q_REL_UPD = f"""
+    UPDATE payment_hold
+    SET status='RELEASED', released_at=now(), released_by=$3, release_reason=$4
+    WHERE client_id = $1 AND hold_id = $2 AND status = 'ACTIVE'
+    RETURNING {_HOLD_COLS}
+"""
+
+# Handlers return _JSONResponse directly: rows already have the HoldModel shape,
+# so FastAPI's validation and jsonable_encoder pass are skipped. HoldModel stays
+# in `responses` for the OpenAPI docs only. asyncpg decodes uuid columns to its
+# own uuid.UUID subclass, which orjson only serializes for the exact stdlib type,
+# so _json_default converts those; anything else still raises TypeError.
+def _json_default(obj):
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError
+
+class _JSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(title="T-Bank Payments Hold API (JWT/RBAC)", default_response_class=_JSONResponse)
+
+async def _init_connection(conn):
+    await conn.set_type_codec(
+        "json", encoder=lambda obj: orjson.dumps(obj).decode(), decoder=orjson.loads, schema="pg_catalog",
+    )
 
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS "uuid-ossp";'))
-        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pgcrypto;'))
+    global pool
+    url = make_url(DATABASE_URL)
+    pool = await asyncpg.create_pool(
+        user=url.username,
+        password=url.password,
+        host=url.host,
+        port=url.port,
+        database=url.database,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_queries=50000,
+        max_inactive_connection_lifetime=3600,
+        statement_cache_size=1024,
+        # JIT only adds planning overhead to these short OLTP queries; UTC gives the
+        # timestamps json_build_object renders in :check the same offset as the
+        # ones serialized in Python on the other endpoints
+        server_settings={"jit": "off", "TimeZone": "UTC"},
+        init=_init_connection,
+        **url.query,
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    await pool.close()
 
-@app.post("/v1/clients/{clientId}/payment-holds", status_code=201, response_model=HoldModel)
+@app.post("/v1/clients/{clientId}/payment-holds", status_code=201, responses={201: {"model": HoldModel}})
 async def create_hold(
     clientId: UUID,
     body: CreateHoldBody,
     idempotency_key: str = Header(..., alias="Idempotency-Key"),
     principal: Principal = Depends(require_roles("ops.block:create")),
 ):
-    if body.expiresAt and body.expiresAt <= _now():
-        raise HTTPException(status_code=422, detail="expiresAt must be in future")
-    async with async_session() as session:
-        q_exists = text("SELECT 1 FROM client WHERE client_id = CAST(:cid AS uuid)")
-        res = await session.execute(q_exists, {"cid": str(clientId)})
-        if res.scalar() is None:
+    async with pool.acquire() as conn:
+        try:
+            row = await conn.fetchrow(
+                _Q_INS, clientId, body.type, body.comment, body.source,
+                principal.sub, body.expiresAt, idempotency_key,
+            )
+        except asyncpg.ForeignKeyViolationError:
             raise HTTPException(status_code=422, detail="Client does not exist")
-
-        q_idem = text("SELECT * FROM payment_hold WHERE idempotency_key = :ik LIMIT 1")
-        row = (await session.execute(q_idem, {"ik": idempotency_key})).mappings().first()
-        if row:
-            return _row_to_hold(row)
-
-        q_ins = text("""
-            INSERT INTO payment_hold
-                (client_id, type, status, comment, source, created_by, expires_at, idempotency_key)
-            VALUES
-            (CAST(:client_id AS uuid), :type, 'ACTIVE',
-                :comment, :source, :created_by, :expires_at, :ik)
-            RETURNING *
-        """)
-
-        r = await session.execute(q_ins, {
-            "client_id": str(clientId),
-            "type": body.type,
-            "comment": body.comment,
-            "source": body.source,
-            "created_by": principal.sub,
-            "expires_at": body.expiresAt,
-            "ik": idempotency_key,
-        })
-        await session.commit()
-        return _row_to_hold(r.mappings().first())
+        except asyncpg.CheckViolationError as e:
+            # expiry is validated against the database clock
+            if e.constraint_name == "payment_hold_future_exp":
+                raise HTTPException(status_code=422, detail="expiresAt must be in future")
+            raise
+        if row is None:
+            raise HTTPException(status_code=409, detail="Idempotency-Key already used for another client")
+        return _JSONResponse(_row_to_hold(row), status_code=201)
 
 @app.get("/v1/clients/{clientId}/payment-holds")
 async def list_holds(
     clientId: UUID,
     status: Literal["ACTIVE", "RELEASED", "ALL"] = "ACTIVE",
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     principal: Principal = Depends(require_roles("ops.block:read")),
 ):
-    async with async_session() as session:
-        if status == "ALL":
-            q = text("SELECT * FROM payment_hold WHERE client_id = CAST(:cid AS uuid) ORDER BY created_at DESC")
-            res = await session.execute(q, {"cid": str(clientId)})
-        else:
-            q = text("""
-                SELECT * FROM payment_hold
-                WHERE client_id = CAST(:cid AS uuid) AND status = :st
-                ORDER BY created_at DESC
-            """)
-            res = await session.execute(q, {"cid": str(clientId), "st": status})
-        items = [_row_to_hold(m) for m in res.mappings().all()]
-        return {"items": items}
+    after_created, after_hold = _decode_cursor(cursor) if cursor else (None, None)
+    # one extra row tells whether another page exists
+    if status == "ALL":
+        query, args = _Q_LIST_ALL, (clientId, after_created, after_hold, limit + 1)
+    else:
+        query, args = _Q_LIST_STATUS, (clientId, after_created, after_hold, limit + 1, status)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    items = [_row_to_hold(row) for row in rows[:limit]]
+    next_cursor = _encode_cursor(items[-1]["createdAt"], items[-1]["holdId"]) if len(rows) > limit else None
+    return _JSONResponse({"items": items, "nextCursor": next_cursor})
 
 @app.get("/v1/clients/{clientId}/payment-holds:check")
 async def check_hold(clientId: UUID, principal: Principal = Depends(require_roles("ops.block:read"))):
-    async with async_session() as session:
-        q = text("""
-            SELECT * FROM payment_hold
-            WHERE client_id = CAST(:cid AS uuid) AND status = 'ACTIVE'
-        """)
-        res = await session.execute(q, {"cid": str(clientId)})
-        rows = res.mappings().all()
-        blocked = len(rows) > 0
-        kind = "NONE"
-        if blocked:
-            types = {r["type"] for r in rows}
-            kind = "FRAUD" if "FRAUD_SUSPECT" in types else "NON_FRAUD"
-        return {"blocked": blocked, "kind": kind, "activeHolds": [_row_to_hold(r) for r in rows]}
-
-@app.get("/v1/clients/{clientId}/payment-holds/{holdId}", response_model=HoldModel)
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(_Q_CHECK, clientId)
+        kind = "FRAUD" if row["fraud"] else ("NON_FRAUD" if row["blocked"] else "NONE")
+        return _JSONResponse({"blocked": row["blocked"], "kind": kind, "activeHolds": row["holds"] or []})
+
+@app.get("/v1/clients/{clientId}/payment-holds/{holdId}", responses={200: {"model": HoldModel}})
 async def get_hold(clientId: UUID, holdId: UUID, principal: Principal = Depends(require_roles("ops.block:read"))):
-    async with async_session() as session:
-        q = text("""
-            SELECT * FROM payment_hold
-            WHERE client_id = CAST(:cid AS uuid) AND hold_id = CAST(:hid AS uuid)
-        """)
-        row = (await session.execute(q, {"cid": str(clientId), "hid": str(holdId)})).mappings().first()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(_Q_GET, clientId, holdId)
         if not row:
             raise HTTPException(status_code=404, detail="Not found")
-        return _row_to_hold(row)
+        return _JSONResponse(_row_to_hold(row))
 
-@app.post("/v1/clients/{clientId}/payment-holds/{holdId}:release", response_model=HoldModel)
+@app.post("/v1/clients/{clientId}/payment-holds/{holdId}:release", responses={200: {"model": HoldModel}})
 async def release_hold(
     clientId: UUID,
     holdId: UUID,
-    body: ReleaseBody | None = None,
+    body: ReleaseBody = Body(default_factory=ReleaseBody),
     principal: Principal = Depends(require_roles("ops.block:release")),
 ):
-    async with async_session() as session:
-        q_sel = text("""
-            SELECT * FROM payment_hold
-            WHERE client_id = CAST(:cid AS uuid) AND hold_id = CAST(:hid AS uuid)
-        """)
-        row = (await session.execute(q_sel, {"cid": str(clientId), "hid": str(holdId)})).mappings().first()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            _Q_REL_UPD, clientId, holdId, principal.sub, body.reason,
+        )
         if not row:
-            raise HTTPException(status_code=404, detail="Not found")
-        if row["status"] != "ACTIVE":
+            if not await conn.fetchrow(_Q_GET, clientId, holdId):
+                raise HTTPException(status_code=404, detail="Not found")
             raise HTTPException(status_code=409, detail="Already closed")
+        return _JSONResponse(_row_to_hold(row))
+
+# Opaque, URL-safe page cursor: base64url of [createdAt, holdId] of the last item.
+def _encode_cursor(created_at: datetime, hold_id) -> str:
+    raw = orjson.dumps([created_at.isoformat(), str(hold_id)])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, hold_id = orjson.loads(raw)
+        return datetime.fromisoformat(created_at), UUID(hold_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
 
-        q_upd = text("""
-            UPDATE payment_hold
-            SET status='RELEASED', released_at=now(), released_by=:by, release_reason=:reason
-            WHERE hold_id = CAST(:hid AS uuid)
-            RETURNING *
-        """)
-        r = await session.execute(q_upd, {
-            "hid": str(holdId),
-            "reason": (body.reason if body else None),
-            "by": principal.sub
-        })
-        await session.commit()
-        return _row_to_hold(r.mappings().first())
-
-def _row_to_hold(m):
-    return {
-        "holdId": m["hold_id"],
-        "clientId": m["client_id"],
-        "type": m["type"],
-        "status": m["status"],
-        "comment": m["comment"],
-        "source": m["source"],
-        "createdAt": m["created_at"],
-        "createdBy": m["created_by"],
-        "expiresAt": m["expires_at"],        
-        "releasedAt": m["released_at"],
-        "releasedBy": m["released_by"],
-        "releaseReason": m["release_reason"],
-        "idempotencyKey": m["idempotency_key"],
-    }
\ No newline at end of file
+def _row_to_hold(row):
+    return dict(zip(_HOLD_KEYS, row))
@@ -31,9 +31,21 @@ CREATE TABLE IF NOT EXISTS payment_hold (
   released_by TEXT,
   release_reason TEXT,
   idempotency_key TEXT NOT NULL,
-  CONSTRAINT unique_idem UNIQUE (idempotency_key)
+  -- B-tree unique index: arbiter for INSERT ... ON CONFLICT and the only
+  -- idempotency lookup path, so no separate hash index is kept.
+  CONSTRAINT unique_idem UNIQUE (idempotency_key),
+  CONSTRAINT payment_hold_future_exp CHECK (expires_at IS NULL OR expires_at > created_at)
 );
 
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'payment_hold_future_exp') THEN
+    ALTER TABLE payment_hold
+      ADD CONSTRAINT payment_hold_future_exp CHECK (expires_at IS NULL OR expires_at > created_at);
+  END IF;
+END$$;
+
+-- payment-holds:check
 CREATE INDEX IF NOT EXISTS ix_payment_hold_client_active
   ON payment_hold (client_id)
   WHERE status = 'ACTIVE';
@@ -42,6 +54,17 @@ CREATE INDEX IF NOT EXISTS ix_payment_hold_client_type_active
   ON payment_hold (client_id, type)
   WHERE status = 'ACTIVE';
 
+-- list_holds keyset pages, served by index-only scans
+CREATE INDEX IF NOT EXISTS ix_payment_hold_client_status_created
+  ON payment_hold (client_id, status, created_at DESC, hold_id DESC)
+  INCLUDE (type, comment, source, created_by, expires_at,
+           released_at, released_by, release_reason, idempotency_key);
+
+-- status=ALL pages: status is the second key above, so that index cannot return
+-- a client's rows in created_at order without a sort
+CREATE INDEX IF NOT EXISTS ix_payment_hold_client_created
+  ON payment_hold (client_id, created_at DESC, hold_id DESC);
+
 CREATE INDEX IF NOT EXISTS ix_payment_hold_expires
   ON payment_hold (expires_at)
   WHERE status = 'ACTIVE' AND expires_at IS NOT NULL;
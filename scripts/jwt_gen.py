@@ -1,7 +1,7 @@
 import os, jwt, sys
 from datetime import datetime, timedelta, timezone
 
-JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
+JWT_SECRET_BYTES = os.getenv("JWT_SECRET", "dev-secret-change-me").encode("utf-8")
 ALG = "HS256"
 
 def make(sub: str, roles: list[str], ttl_minutes: int = 120):
@@ -12,7 +12,7 @@ def make(sub: str, roles: list[str], ttl_minutes: int = 120):
         "iat": int(now.timestamp()),
         "exp": int((now + timedelta(minutes=ttl_minutes)).timestamp())
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=ALG)
+    token = jwt.encode(payload, JWT_SECRET_BYTES, algorithm=ALG)
     return token
 
 if __name__ == "__main__":
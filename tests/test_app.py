@@ -0,0 +1,303 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+import jwt
+import pytest
+from asyncpg.pgproto.pgproto import UUID as PgUUID
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+
+import app as api
+
+CLIENT_ID = "7d2b2b7a-2c0c-4f7c-8a84-2f4a3f686e55"
+HOLD_ID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+CREATED_AT = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _hold_row(hold_id=HOLD_ID, created_at=CREATED_AT, status="ACTIVE"):
+    # asyncpg hands uuid columns back as its own uuid.UUID subclass
+    return (
+        PgUUID(hold_id), PgUUID(CLIENT_ID), "FRAUD_SUSPECT", status, None, None,
+        created_at, "user:ops1", None, None, None, None, "idem-1",
+    )
+
+
+class FakeConn:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    async def fetchrow(self, query, *args):
+        self.calls.append((query, args))
+        result = self.results.get(query)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def fetch(self, query, *args):
+        self.calls.append((query, args))
+        return self.results.get(query, [])
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+
+def _auth(roles=("ops.block:read", "ops.block:create", "ops.block:release")):
+    now = datetime.now(timezone.utc)
+    token = jwt.encode(
+        {"sub": "user:ops1", "roles": list(roles), "exp": int((now + timedelta(minutes=5)).timestamp())},
+        api.JWT_SECRET_BYTES,
+        algorithm="HS256",
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _use(monkeypatch, results):
+    conn = FakeConn(results)
+    monkeypatch.setattr(api, "pool", FakePool(conn))
+    return conn
+
+
+def test_create_hold_serializes_asyncpg_uuids(client, monkeypatch):
+    _use(monkeypatch, {api._Q_INS: _hold_row()})
+    r = client.post(
+        f"/v1/clients/{CLIENT_ID}/payment-holds",
+        json={"type": "FRAUD_SUSPECT"},
+        headers={**_auth(), "Idempotency-Key": "idem-1"},
+    )
+    assert r.status_code == 201
+    assert r.json()["holdId"] == HOLD_ID
+    assert r.json()["clientId"] == CLIENT_ID
+
+
+def test_create_hold_key_reused_by_another_client(client, monkeypatch):
+    # the scoped ON CONFLICT returns no row when the key belongs to another client
+    _use(monkeypatch, {api._Q_INS: None})
+    r = client.post(
+        f"/v1/clients/{CLIENT_ID}/payment-holds",
+        json={"type": "FRAUD_SUSPECT"},
+        headers={**_auth(), "Idempotency-Key": "idem-1"},
+    )
+    assert r.status_code == 409
+
+
+def test_create_hold_unknown_client(client, monkeypatch):
+    _use(monkeypatch, {api._Q_INS: asyncpg.ForeignKeyViolationError("fk")})
+    r = client.post(
+        f"/v1/clients/{CLIENT_ID}/payment-holds",
+        json={"type": "FRAUD_SUSPECT"},
+        headers={**_auth(), "Idempotency-Key": "idem-1"},
+    )
+    assert r.status_code == 422
+    assert r.json()["detail"] == "Client does not exist"
+
+
+def test_create_hold_expiry_in_past(client, monkeypatch):
+    _use(monkeypatch, {api._Q_INS: asyncpg.CheckViolationError.new({
+        "C": "23514", "M": "check violation", "n": "payment_hold_future_exp",
+    })})
+    r = client.post(
+        f"/v1/clients/{CLIENT_ID}/payment-holds",
+        json={"type": "FRAUD_SUSPECT"},
+        headers={**_auth(), "Idempotency-Key": "idem-1"},
+    )
+    assert r.status_code == 422
+    assert r.json()["detail"] == "expiresAt must be in future"
+
+
+def test_create_hold_other_check_violation_is_not_masked(monkeypatch):
+    _use(monkeypatch, {api._Q_INS: asyncpg.CheckViolationError.new({
+        "C": "23514", "M": "check violation", "n": "some_other_check",
+    })})
+    client = TestClient(api.app, raise_server_exceptions=False)
+    r = client.post(
+        f"/v1/clients/{CLIENT_ID}/payment-holds",
+        json={"type": "FRAUD_SUSPECT"},
+        headers={**_auth(), "Idempotency-Key": "idem-1"},
+    )
+    assert r.status_code == 500
+
+
+def test_get_and_release_hold(client, monkeypatch):
+    _use(monkeypatch, {api._Q_GET: _hold_row(), api._Q_REL_UPD: _hold_row(status="RELEASED")})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds/{HOLD_ID}", headers=_auth())
+    assert r.status_code == 200
+    assert r.json()["holdId"] == HOLD_ID
+    r = client.post(f"/v1/clients/{CLIENT_ID}/payment-holds/{HOLD_ID}:release", headers=_auth())
+    assert r.status_code == 200
+    assert r.json()["status"] == "RELEASED"
+
+
+def test_release_distinguishes_missing_and_closed(client, monkeypatch):
+    _use(monkeypatch, {})
+    r = client.post(f"/v1/clients/{CLIENT_ID}/payment-holds/{HOLD_ID}:release", headers=_auth())
+    assert r.status_code == 404
+    _use(monkeypatch, {api._Q_GET: _hold_row(status="RELEASED")})
+    r = client.post(f"/v1/clients/{CLIENT_ID}/payment-holds/{HOLD_ID}:release", headers=_auth())
+    assert r.status_code == 409
+
+
+def test_check_hold(client, monkeypatch):
+    holds = [{"holdId": HOLD_ID, "type": "FRAUD_SUSPECT", "createdAt": "2026-01-01T12:00:00+00:00"}]
+    _use(monkeypatch, {api._Q_CHECK: {"blocked": True, "fraud": True, "holds": holds}})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds:check", headers=_auth())
+    assert r.status_code == 200
+    assert r.json() == {"blocked": True, "kind": "FRAUD", "activeHolds": holds}
+
+    _use(monkeypatch, {api._Q_CHECK: {"blocked": False, "fraud": False, "holds": None}})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds:check", headers=_auth())
+    assert r.json() == {"blocked": False, "kind": "NONE", "activeHolds": []}
+
+
+def test_list_holds_serializes_asyncpg_uuids(client, monkeypatch):
+    _use(monkeypatch, {api._Q_LIST_STATUS: [_hold_row()]})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds", headers=_auth())
+    assert r.status_code == 200
+    assert [h["holdId"] for h in r.json()["items"]] == [HOLD_ID]
+
+
+def test_list_holds_cursor_round_trip(client, monkeypatch):
+    # three holds from one transaction share created_at; the cursor must carry hold_id too
+    ids = [
+        "ffffffff-0000-4000-8000-000000000003",
+        "ffffffff-0000-4000-8000-000000000002",
+        "ffffffff-0000-4000-8000-000000000001",
+    ]
+    conn = _use(monkeypatch, {api._Q_LIST_STATUS: [_hold_row(hold_id=i) for i in ids]})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds?limit=2", headers=_auth())
+    assert r.status_code == 200
+    body = r.json()
+    assert [h["holdId"] for h in body["items"]] == ids[:2]
+    assert body["nextCursor"]
+
+    r = client.get(
+        f"/v1/clients/{CLIENT_ID}/payment-holds",
+        params={"limit": 2, "cursor": body["nextCursor"]},
+        headers=_auth(),
+    )
+    assert r.status_code == 200
+    _, args = conn.calls[-1]
+    assert args[1] == CREATED_AT
+    assert str(args[2]) == ids[1]
+    assert args[3] == 3
+
+
+def test_list_holds_rejects_bad_cursor(client, monkeypatch):
+    _use(monkeypatch, {})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds?cursor=not-a-cursor", headers=_auth())
+    assert r.status_code == 422
+
+
+def test_rejects_missing_role(client, monkeypatch):
+    _use(monkeypatch, {})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds/{HOLD_ID}", headers=_auth(roles=("other",)))
+    assert r.status_code == 403
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _sign(payload, header=None, key=None, digest=hashlib.sha256):
+    header = {"alg": "HS256", "typ": "JWT"} if header is None else header
+    signing_input = f"{_b64(json.dumps(header).encode())}.{_b64(json.dumps(payload).encode())}"
+    sig = hmac.new(key or api.JWT_SECRET_BYTES, signing_input.encode(), digest).digest()
+    return f"{signing_input}.{_b64(sig)}"
+
+
+def _bad_tokens(now):
+    valid = _sign({"sub": "user:ops1", "exp": now + 60})
+    header, _, sig = valid.split(".")
+    forged_payload = _b64(json.dumps({"sub": "admin", "exp": now + 60}).encode())
+    return {
+        "tampered payload": f"{header}.{forged_payload}.{sig}",
+        "wrong key": _sign({"sub": "user:ops1", "exp": now + 60}, key=b"other-secret"),
+        "alg none": f"{_b64(json.dumps({'alg': 'none'}).encode())}.{valid.split('.')[1]}.",
+        "alg HS512": _sign({"sub": "user:ops1", "exp": now + 60}, header={"alg": "HS512"}, digest=hashlib.sha512),
+        "expired": _sign({"sub": "user:ops1", "exp": now - 1}),
+        "future nbf": _sign({"sub": "user:ops1", "exp": now + 60, "nbf": now + 30}),
+        "future iat": _sign({"sub": "user:ops1", "exp": now + 60, "iat": now + 30}),
+        "non-numeric exp": _sign({"sub": "user:ops1", "exp": "soon"}),
+        "bad base64": f"!!!.{valid.split('.')[1]}.{sig}",
+        "two segments": f"{header}.{valid.split('.')[1]}",
+        "aud present": _sign({"sub": "user:ops1", "exp": now + 60, "aud": "other-service"}),
+    }
+
+
+@pytest.mark.parametrize("case", list(_bad_tokens(0)))
+def test_decode_jwt_rejects_what_pyjwt_rejects(case):
+    now = int(time.time())
+    token = _bad_tokens(now)[case]
+    with pytest.raises(jwt.PyJWTError):
+        jwt.decode(token, api.JWT_SECRET_BYTES, algorithms=["HS256"])
+    with pytest.raises(ValueError):
+        api._decode_jwt(token, now)
+
+
+def test_decode_jwt_rejects_non_string_kid():
+    # PyJWT enforces this in get_unverified_header rather than in decode
+    token = _sign({"sub": "user:ops1", "exp": int(time.time()) + 60}, header={"alg": "HS256", "kid": 1})
+    with pytest.raises(jwt.PyJWTError):
+        jwt.get_unverified_header(token)
+    with pytest.raises(ValueError):
+        api._decode_jwt(token, int(time.time()))
+
+
+def test_decode_jwt_accepts_valid_token():
+    now = int(time.time())
+    token = _sign({"sub": "user:ops1", "roles": ["ops.block:read"], "exp": now + 60, "iat": now, "aud": ""})
+    assert api._decode_jwt(token, now) == jwt.decode(token, api.JWT_SECRET_BYTES, algorithms=["HS256"])
+
+
+def test_token_with_audience_is_unauthorized(client, monkeypatch):
+    _use(monkeypatch, {})
+    token = _sign({"sub": "user:ops1", "roles": ["ops.block:read"],
+                   "exp": int(time.time()) + 60, "aud": "other-service"})
+    r = client.get(f"/v1/clients/{CLIENT_ID}/payment-holds/{HOLD_ID}",
+                   headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 401
+
+
+def test_principal_cache_never_outlives_exp(monkeypatch):
+    api._jwt_cache.clear()
+    clock = [2_000_000_000.0]
+    monkeypatch.setattr(api, "time", types.SimpleNamespace(time=lambda: clock[0]))
+    # exp is inside the cache TTL, so the entry must be bounded by exp, not by the TTL
+    token = _sign({"sub": "user:ops1", "roles": ["ops.block:read"], "exp": 2_000_000_002})
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    first = asyncio.run(api.get_principal(creds))
+    clock[0] += 1
+    assert asyncio.run(api.get_principal(creds)) is first
+
+    clock[0] = 2_000_000_002.0
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api.get_principal(creds))
+    assert exc.value.status_code == 401